@@ -15,19 +15,25 @@
 
 # ### First we must import packages and read in the data to prepare the analysis.
 
-# In[1]:
+# In[ ]:
 
 
 # Import all of the packages that are necessary for the demonstration.
 # Pandas will be used for reading in uml.csv as well as analyzing it
+# Numpy is used for fast counting over arrays
+# Numba compiles python functions into fast machine code
 # Geopandas is used to facilitate working with spatial data
-# shapely.geometry is a package that works with Geopandas and creates geometric objects
+# shapely is a package that works with Geopandas and creates geometric objects
 # matplotlib will allow the script to map out objects
+# pickle is used to save a copy of a finished map so it can be reused
 
+import pickle
 import pandas as pd
+import numpy as np
 import geopandas as gpd
-from shapely.geometry import Point
-from mpl_toolkits.basemap import Basemap
+from geopandas.array import GeometryArray
+import shapely
+from numba import njit
 import matplotlib.pyplot as plt
 
 #the magic function runs on the backend and allows plots to be shown beneath each kernel 
@@ -35,36 +41,62 @@ import matplotlib.pyplot as plt
 get_ipython().run_line_magic('matplotlib', 'inline')
 
 
-# In[2]:
+# In[ ]:
 
 
-# read in csv and save it to variable df using pandas
+# read in csv and save it to variable df using pandas. The pyarrow engine reads the columns in parallel, and the
+# dtype mapping stores the repeated text columns as categories and the coordinates as smaller float32 numbers
 
-df = pd.read_csv('uml.csv')
+df = pd.read_csv('uml.csv', engine='pyarrow',
+                 dtype={'Country': 'category', 'Parent_Com': 'category', 'RSPO_STATU': 'category',
+                        'Latitude': 'float32', 'Longitude': 'float32'})
 
+# Questions 3, 4 and 5 all look at the Country, Parent_Com and RSPO_STATU columns. The summarize function goes
+# through their category codes once and, at the same time, counts the mills in each country, counts the mills
+# with an unknown parent company, and marks which mills are RSPO Certified. The loop is not run in parallel
+# because two rows of the same country would then add to the same count at once. cache=True saves the compiled
+# function to disk so it isn't compiled again every time the notebook is restarted.
 
-# In[3]:
+@njit(cache=True)
+def summarize(country_codes, parent_codes, rspo_codes, n_countries, is_unknown, cert_code):
+    counts = np.zeros(n_countries, np.int64)
+    unknown = 0
+    certified = np.empty(len(country_codes), np.bool_)
+    for i in range(len(country_codes)):
+        if country_codes[i] >= 0:
+            counts[country_codes[i]] += 1
+        if parent_codes[i] >= 0 and is_unknown[parent_codes[i]]:
+            unknown += 1
+        certified[i] = rspo_codes[i] == cert_code
+    return counts, unknown, certified
 
+country_counts, unknown_count, certified_mask = summarize(
+    df.Country.cat.codes.to_numpy(), df.Parent_Com.cat.codes.to_numpy(), df.RSPO_STATU.cat.codes.to_numpy(),
+    len(df.Country.cat.categories), df.Parent_Com.cat.categories.isin(['Unknown', 'unknown']),
+    df.RSPO_STATU.cat.categories.get_loc('RSPO Certified'))
 
-# By using a lambda function, the points variable contains a loop in which the Longitude and Latitude
-# columns are looped over and turned into Point objects. This allows data manipulation with geopandas
 
-points = df.apply(lambda row: Point(row.Longitude, row.Latitude), axis=1)
-points.head(3)
+# In[ ]:
 
 
-# In[4]:
+# The to_geo function turns a dataframe into a GeoDataFrame. shapely.points takes the whole Longitude and Latitude
+# columns at once and turns them into Point objects in a single vectorized call, instead of looping over every row,
+# and GeometryArray wraps them for geopandas as they are.
+# The crs argument ensures that the dataframe views geometry as latitude and longitude values.
+# Only the static maps need these Point objects, so the google maps cells further down skip this step.
 
+def to_geo(df):
+    geoms = GeometryArray(shapely.points(df.Longitude.to_numpy(), df.Latitude.to_numpy()), crs='EPSG:4326')
+    return gpd.GeoDataFrame(df, geometry=geoms)
 
-# GeoDataFrames are like normal data frames but with geometry attached to them.
-# The mills variable creates a new column which is equal to the previously made variable points (right-most column).
 
-mills = gpd.GeoDataFrame(df, geometry = points)
+# In[ ]:
+
 
-# Ensures that the dataframe views geometry as latitude and longitude values
+# GeoDataFrames are like normal data frames but with geometry attached to them.
+# A preview of the first three rows shows the new geometry column (right-most column).
 
-mills.crs = {'init': 'epsg:4326'}
-mills.head(3)
+to_geo(df.head(3))
 
 
 # # 1) How large/ how many rows are in the dataset?
@@ -83,13 +115,18 @@ len(df)
 
 # ### There are two ways to do this, by finding out the 'corners', or the uppermost and bottommost points of the Longitude and Latitude columns of our data, or by visually projecting it.
 
-# In[6]:
+# In[ ]:
 
 
-# Creates two variables. Both are lists which take the max and min of the longitude and latitude columns.
+# The mills variable holds the GeoDataFrame of every mill, and is used by the maps below.
+# total_bounds finds the min and max of the longitude and latitude of every mill in one call.
+# Creates two variables. Both are lists which take the max and min of the longitude and latitude, rounded to
+# 5 decimals (about 1 meter), which is as precise as the float32 coordinates are at longitudes over 100.
 
-upper = [df.Longitude.max(), df.Latitude.max()]
-lower = [df.Longitude.min(), df.Latitude.min()]
+mills = to_geo(df)
+minx, miny, maxx, maxy = mills.total_bounds
+upper = np.round([maxx, maxy], 5).tolist()
+lower = np.round([minx, miny], 5).tolist()
 
 print (upper)
 print (lower)
@@ -97,31 +134,71 @@ print (lower)
 
 # ### The coordinates above represent the 'bounding box' of our dataset, but they aren't easily understandable. The next step will plot the entire dataset onto a map.
 
-# In[7]:
+# In[ ]:
 
 
-# Brings in basic world map from the Geopandas library.
+# Datashader draws large amounts of points straight into an image, which stays fast as the mill list grows.
 
-world = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
+import datashader as ds
 
-# Creates basic configuration for the map. This includes size, color, boundary color, and background color.
+# Brings in basic world map from the Geopandas library. The pyogrio engine is much faster than the default fiona
+# reader, and use_arrow reads the whole file in columns at once instead of one country at a time.
 
-ax = world.plot(figsize = (24, 50), color='lightgreen', edgecolor='black')
-ax.set_facecolor('aqua')
+world = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'), engine='pyogrio', use_arrow=True)
 
-# Takes the mills variable, which read in all of the lat long values in the df and plots them onto the map.
+# Simplifies the country outlines once so they have fewer points to draw, and world_s is reused for the second map.
+# preserve_topology keeps small islands, like the Solomon Islands, from being simplified away.
 
-mills.plot(ax=ax, color='red', zorder=1)
+world_s = world.copy()
+world_s.geometry = world.geometry.simplify(0.1, preserve_topology=True)
+
+# Creates basic configuration for the map. This includes size, color, boundary color, and background color.
+# The empty map is drawn once and saved with pickle as base_map, so both maps start from a copy of it instead of
+# plotting every country again. The original figure is closed so it isn't shown on its own.
+
+base_fig, base_ax = plt.subplots(figsize = (40, 40))
+world_s.plot(ax=base_ax, color='lightgreen', edgecolor='black')
+base_ax.set_facecolor('aqua')
+base_map = pickle.dumps(base_fig)
+plt.close(base_fig)
+
+fig = pickle.loads(base_map)
+fig.set_size_inches(24, 50)
+ax = fig.axes[0]
+
+# Works out how many screen pixels one degree takes up on this map, and how many pixels wide a dot should be to
+# match the default matplotlib marker. The bounding box found above is padded by one dot so mills on its edge
+# aren't cut off.
+
+ax.apply_aspect()
+px_per_degree = ax.get_position().width * fig.get_figwidth() * fig.dpi / (ax.get_xlim()[1] - ax.get_xlim()[0])
+radius = round(3 * fig.dpi / 72)
+pad = radius / px_per_degree
+x_range = (minx - pad, maxx + pad)
+y_range = (miny - pad, maxy + pad)
+
+# Takes the lat long values in the df and draws them as solid red dots into an image with one pixel for every
+# screen pixel of the padded box. The image is then laid over the map in that same box. Autoscale is turned off
+# first so the map keeps showing the whole world instead of zooming into the image.
+
+canvas = ds.Canvas(plot_width=round((x_range[1] - x_range[0]) * px_per_degree),
+                   plot_height=round((y_range[1] - y_range[0]) * px_per_degree),
+                   x_range=x_range, y_range=y_range)
+agg = canvas.points(df, 'Longitude', 'Latitude')
+img = ds.tf.spread(ds.tf.shade(agg, cmap=['red'], min_alpha=255), px=radius, shape='circle')
+
+ax.set_autoscale_on(False)
+ax.imshow(img.to_pil(), extent=(*x_range, *y_range), interpolation='nearest', zorder=1)
 
 # Creates a title for map and indicates fontsize
 
-plt.title('Palm Oil Mills', color='black', fontsize = 50)
+ax.set_title('Palm Oil Mills', color='black', fontsize = 50)
 plt.show()
 
 
 # ### The same data can also be displayed using the google maps api, which make the map interactive rather than a static image.
 
-# In[8]:
+# In[ ]:
 
 
 # Import the necessary packages. gmaps allows the api key to be registered, as well as use the functions within it.
@@ -129,14 +206,15 @@ plt.show()
 import gmaps
 
 # Using pandas, the line creates a subset the uml.csv table. It takes only the latitude and longitude coordinates,
-# which will then be plotted onto the map.
+# which will then be plotted onto the map. to_numpy turns them into a plain array, which is all gmaps needs,
+# and the coords variable is reused for the certified map further down.
 
-locations = df[['Latitude', 'Longitude']]
+coords = df[['Latitude', 'Longitude']].to_numpy()
 
-# Creates the basemap, instructs what type of map it will be (heatmap) and adds the locations variable to the map.
+# Creates the basemap, instructs what type of map it will be (heatmap) and adds the coords variable to the map.
 
 fig = gmaps.figure()
-symbol = gmaps.heatmap_layer(locations)
+symbol = gmaps.heatmap_layer(coords)
 fig.add_layer(symbol)
 fig
 
@@ -157,24 +235,27 @@ df.Parent_Com.isnull().sum()
 
 # ### Since there are none, find if Unknown or unknown are spelt differently
 
-# In[10]:
+# In[ ]:
 
 
-# Sorts through the Parent_Com column for any values that are equal to either spelling of unknown.
+# unknown_count was made by the summarize function when the data was read in. It counts the values in the
+# Parent_Com column that are equal to either spelling of unknown.
 
-df[(df.Parent_Com == 'Unknown') | (df.Parent_Com == 'unknown')]
+unknown_count
 
 
-# ## By sorting through both spellings, and looking at the amount of rows, there are 93 mills with an unknown parent company.
+# ## By counting both spellings, there are 93 mills with an unknown parent company.
 
 # # 4) Which country has the most palm oil mills?
 
-# In[11]:
+# In[ ]:
 
 
-# Points out the most recurring value in the 'Country' column.
+# Points out the most recurring value in the 'Country' column. Since Country is stored as a category, every
+# country has a number code; country_counts (from the summarize function) holds how many mills each code has,
+# and argmax picks the largest without having to sort the whole table first.
 
-df['Country'].value_counts().idxmax()
+df.Country.cat.categories[country_counts.argmax()]
 
 
 # ### Indonesia has the most, but the command didn't specify how many. The next line will. 
@@ -193,31 +274,31 @@ df['Country'].value_counts()
 
 # ### The first step is to separate those mills that are certified from those that are not.
 
-# In[13]:
+# In[ ]:
 
 
-# Certified and non_certified take all rows in which the column value equals the expressions 'RSPO Certified'
-# or 'Not RSPO Certified'. Using the .loc function from pandas, itt creates a subset of data and
-# assigns it to their respective variables.
+# The certified_mask variable (from the summarize function) marks which rows have the value 'RSPO Certified'.
+# Every other row is 'Not RSPO Certified'. np.flatnonzero turns the mask and its opposite (~) into lists of row
+# positions, and the .take function from pandas picks those rows to create both subsets of data and assign
+# them to their respective variables. They are reused in the maps below.
 
-certified = mills.loc[df['RSPO_STATU'] == 'RSPO Certified']
-not_certified = mills.loc[df['RSPO_STATU'] == 'Not RSPO Certified']
+certified = mills.take(np.flatnonzero(certified_mask))
+not_certified = mills.take(np.flatnonzero(~certified_mask))
 
-print (certified.count())
-print (not_certified.count())
+print (len(certified), len(not_certified))
 
 
 # ### By printing out the result of both variables, there are  356 certified mills, and 1462 non certified mills.
 
 # ### Next is to create a map and plot the variables onto it.
 
-# In[14]:
+# In[ ]:
 
 
-# Creates basic configuration for the map. This includes size, color, boundary color, and background color.
+# Makes a copy of the empty map saved earlier, which already has its size, colors, and background color.
 
-ax = world.plot(figsize = (40, 40), color='lightgreen', edgecolor='black')
-ax.set_facecolor('aqua')
+fig = pickle.loads(base_map)
+ax = fig.axes[0]
 
 # Takes the certified and not_certified variables and plots them onto the map.
 
@@ -226,34 +307,28 @@ not_certified.plot(ax=ax, color='blue', alpha=1, zorder=1)
 
 # Creates a title for map and indicates fontsize
 
-plt.title('Certified(Blue) and Not Certified(Red) Palm Oil Mills', color='black', fontsize = 60)
+ax.set_title('Certified(Blue) and Not Certified(Red) Palm Oil Mills', color='black', fontsize = 60)
 plt.show()
 
 
 # ### Once again, the data can be displayed using the Google maps api key to make the map interactive.
 
-# In[15]:
-
+# In[ ]:
 
-# Certified and non_certified take all rows in which the column value equals the expressions 'RSPO Certified'
-# or 'Not RSPO Certified'. Using the .loc function from pandas, itt creates a subset of data and
-# assigns it to their respective variables.
 
-certified = mills.loc[df['RSPO_STATU'] == 'RSPO Certified']
-not_certified = mills.loc[df['RSPO_STATU'] == 'Not RSPO Certified']
+# The map needs to read in the Latitude and Longitude values to plot out the data. The coords array already
+# holds them for every mill, so the lines below filter it with the certified_mask made earlier and its
+# opposite (~) to get the coordinates of each group.
 
-# The map needs to read in the Latitude and Longitude values to plot out the data. Since the certified and
-# not_certified are subsets of the original csv, the lines below will create variables which read the 
-# Latitude and Longitude columns of each variable. Basically, a filter of a filter.
- 
-certified_subset = certified[['Latitude', 'Longitude']]
-not_certified_subset = not_certified[['Latitude', 'Longitude']]
+certified_subset = coords[certified_mask]
+not_certified_subset = coords[~certified_mask]
 
 # The variables below take the certified_subset and not_certified_subset, create symbol layers, and assign colors
-# to them. Blue for certified mills, red for not certified mills.
+# to them. Blue for certified mills, red for not certified mills. The not certified layer has the most mills, so
+# its outline is hidden (stroke_opacity=0) so only the fill is drawn.
 
 symbol_1 = gmaps.symbol_layer(certified_subset, fill_color='blue', stroke_color='blue', scale=2)
-symbol_2 = gmaps.symbol_layer(not_certified_subset, fill_color='red', stroke_color='red', scale=2)
+symbol_2 = gmaps.symbol_layer(not_certified_subset, fill_color='red', stroke_opacity=0, scale=2)
 
 # Creates the basemap, instructs what type of map it will be (heatmap) and adds the locations variable to the map.
 